@@ -10,6 +10,13 @@ DB_NAME = os.getenv('DB_NAME', 'englishbot')
 DB_USER = os.getenv('DB_USER', 'postgres')
 DB_PASSWORD = os.getenv('DB_PASSWORD', 'postgres')
 
+# Размер пачки, которую серверный курсор забирает за один запрос
+CURSOR_ITERSIZE = 2000
+
+# Ключи advisory-блокировок PostgreSQL, общих для всех процессов бота
+SCHEMA_LOCK_KEY = 7301001
+SNAPSHOT_LOCK_KEY = 7301002
+
 
 @contextmanager
 def get_conn():
@@ -29,6 +36,8 @@ def get_conn():
 def create_tables():
     with get_conn() as conn:
         with conn.cursor() as cur:
+            # Процессы, стартующие одновременно, создают схему по очереди
+            cur.execute('SELECT pg_advisory_xact_lock(%s)', (SCHEMA_LOCK_KEY,))
             cur.execute('''
             CREATE TABLE IF NOT EXISTS users (
                 id SERIAL PRIMARY KEY,
@@ -64,6 +73,51 @@ def create_tables():
                 achieved_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
                 UNIQUE(user_id, achievement_id)
             );
+            -- Версия и размер общего словаря: одна строка, которую ведет триггер на `words`
+            CREATE TABLE IF NOT EXISTS words_meta (
+                id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                version BIGINT NOT NULL DEFAULT 1,
+                word_count BIGINT NOT NULL DEFAULT 0
+            );
+            INSERT INTO words_meta (version, word_count)
+            SELECT 1, COUNT(*) FROM words
+            WHERE NOT EXISTS (SELECT 1 FROM words_meta);
+
+            -- Функция и триггеры создаются один раз: повторный DROP TRIGGER
+            -- брал бы ACCESS EXCLUSIVE блокировку на `words` при каждом старте
+            DO $$
+            BEGIN
+                IF NOT EXISTS (SELECT 1 FROM pg_proc WHERE proname = 'bump_words_meta') THEN
+                    CREATE FUNCTION bump_words_meta() RETURNS trigger AS $fn$
+                    BEGIN
+                        UPDATE words_meta SET
+                            version = version + 1,
+                            word_count = CASE
+                                WHEN TG_OP = 'INSERT' THEN word_count + 1
+                                WHEN TG_OP = 'DELETE' THEN word_count - 1
+                                WHEN TG_OP = 'TRUNCATE' THEN 0
+                                ELSE word_count
+                            END;
+                        RETURN NULL;
+                    END;
+                    $fn$ LANGUAGE plpgsql;
+                END IF;
+                IF NOT EXISTS (
+                    SELECT 1 FROM pg_trigger
+                    WHERE tgname = 'words_meta_rows' AND tgrelid = 'words'::regclass
+                ) THEN
+                    CREATE TRIGGER words_meta_rows AFTER INSERT OR UPDATE OR DELETE ON words
+                        FOR EACH ROW EXECUTE FUNCTION bump_words_meta();
+                END IF;
+                IF NOT EXISTS (
+                    SELECT 1 FROM pg_trigger
+                    WHERE tgname = 'words_meta_truncate' AND tgrelid = 'words'::regclass
+                ) THEN
+                    CREATE TRIGGER words_meta_truncate AFTER TRUNCATE ON words
+                        FOR EACH STATEMENT EXECUTE FUNCTION bump_words_meta();
+                END IF;
+            END;
+            $$;
             ''')
             conn.commit()
 
@@ -89,11 +143,7 @@ def get_user_id(telegram_id):
 
 def count_common_words():
     """Возвращает количество слов в общей таблице `words`."""
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute('SELECT COUNT(*) FROM words')
-            result = cur.fetchone()
-            return result[0] if result else 0
+    return get_common_words_meta()[1]
 
 
 def count_user_words(user_id):
@@ -221,25 +271,73 @@ def delete_user_word(user_id, word_en):
             conn.commit()
 
 
-def import_words_from_txt(filepath):
-    """Импортирует слова из файла формата '"word";"перевод"' в таблицу words."""
+def iter_words_from_txt(filepath):
+    """Построчно отдает пары (word_en, word_ru) из файла формата '"word";"перевод"'."""
     with open(filepath, encoding='utf-8') as f:
-        i = 0
         for line in f:
             if not line.strip():
                 continue
+            parts = line.strip().split(';')
+            if len(parts) != 2:
+                continue
+            yield parts[0].strip('"'), parts[1].strip('"')
+
+
+def import_words_from_txt(filepath):
+    """Импортирует слова из файла формата '"word";"перевод"' в таблицу words."""
+    i = 0
+    for word_en, word_ru in iter_words_from_txt(filepath):
+        try:
+            add_word(word_en, word_ru)
+            i += 1
+            if i % 1000 == 0:
+                print(f"  ... {i} words imported.")
+        except Exception:
+            continue
+
+
+def get_common_words_meta():
+    """
+    Возвращает пару (версия, количество слов) общего словаря.
+    Обе величины ведет триггер на `words`, поэтому запрос читает одну строку.
+    """
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute('SELECT version, word_count FROM words_meta')
+            row = cur.fetchone()
+            return (row[0], row[1]) if row else (0, 0)
+
+
+@contextmanager
+def advisory_lock(key):
+    """Держит сессионную advisory-блокировку PostgreSQL, пока выполняется блок."""
+    with get_conn() as conn:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute('SELECT pg_advisory_lock(%s)', (key,))
             try:
-                parts = line.strip().split(';')
-                if len(parts) != 2:
-                    continue
-                word_en = parts[0].strip('"')
-                word_ru = parts[1].strip('"')
-                add_word(word_en, word_ru)
-                i += 1
-                if i % 1000 == 0:
-                    print(f"  ... {i} words imported.")
-            except Exception:
-                continue 
+                yield
+            finally:
+                cur.execute('SELECT pg_advisory_unlock(%s)', (key,))
+
+
+@contextmanager
+def read_common_words(itersize=CURSOR_ITERSIZE):
+    """
+    Отдает (версия, итератор пар (word_en, word_ru)) из таблицы `words`.
+    Версия и строки читаются в одной транзакции REPEATABLE READ,
+    поэтому версия всегда соответствует содержимому.
+    """
+    with get_conn() as conn:
+        conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        with conn.cursor() as cur:
+            cur.execute('SELECT version FROM words_meta')
+            version = cur.fetchone()[0]
+        with conn.cursor(name='common_words') as cur:
+            cur.itersize = itersize
+            cur.execute('SELECT word_en, word_ru FROM words ORDER BY id')
+            yield version, cur
+        conn.rollback()
 
 
 def get_all_word_pairs_with_id(user_id):
@@ -258,23 +356,21 @@ def get_all_word_pairs_with_id(user_id):
             return [(w['id'], w['word_en'], w['word_ru']) for w in all_words] 
 
 
-def get_random_words_for_user(user_id):
+def get_random_user_words(user_id, limit):
     """
-    Возвращает 4 случайные пары (word_en, word_ru) из доступных пользователю слов.
+    Возвращает до `limit` случайных пар (word_en, word_ru) из личных слов пользователя.
+    Общий словарь читается из mmap-снимка (см. snapshot.py), а не из БД.
     """
     with get_conn() as conn:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        with conn.cursor() as cur:
             cur.execute('''
-                SELECT word_en, word_ru FROM (
-                    SELECT word_en, word_ru FROM user_words WHERE user_id = %(user_id)s
-                    UNION
-                    SELECT word_en, word_ru FROM words
-                ) as t
+                SELECT word_en, word_ru FROM user_words
+                WHERE user_id = %s
                 ORDER BY RANDOM()
-                LIMIT 4;
-            ''', {'user_id': user_id})
-            words = cur.fetchall()
-            return [(w['word_en'], w['word_ru']) for w in words]
+                LIMIT %s;
+            ''', (user_id, limit))
+            return cur.fetchall()
+
 
 def log_correct_answer(user_id):
     """Засчитывает один правильный ответ за сегодняшний день."""
@@ -301,19 +397,43 @@ def get_today_correct_answers(user_id):
             row = cur.fetchone()
             return row[0] if row else 0
 
-def get_distractors(user_id, word_to_exclude_en):
-    """Возвращает 3 случайные пары-неправильные ответы, исключая конкретное слово."""
+
+EXPORT_QUERIES = {
+    'word': '''
+        SELECT u.telegram_id, uw.word_en, uw.word_ru
+        FROM user_words uw JOIN users u ON u.id = uw.user_id
+        WHERE %(user_id)s IS NULL OR uw.user_id = %(user_id)s
+        ORDER BY uw.user_id, uw.id
+    ''',
+    'progress': '''
+        SELECT u.telegram_id, p.progress_date, p.correct_answers
+        FROM daily_user_progress p JOIN users u ON u.id = p.user_id
+        WHERE %(user_id)s IS NULL OR p.user_id = %(user_id)s
+        ORDER BY p.user_id, p.progress_date
+    ''',
+    'achievement': '''
+        SELECT u.telegram_id, a.achievement_id, a.achieved_at
+        FROM user_achievements a JOIN users u ON u.id = a.user_id
+        WHERE %(user_id)s IS NULL OR a.user_id = %(user_id)s
+        ORDER BY a.user_id, a.achieved_at
+    ''',
+}
+
+
+def iter_export_rows(user_id=None, itersize=CURSOR_ITERSIZE):
+    """
+    Построчно отдает пары (тип, строка) с личными словами, прогрессом и достижениями.
+    Данные читаются серверными (именованными) курсорами пачками по `itersize`,
+    поэтому потребление памяти не зависит от объема экспорта.
+    Если `user_id` не задан, выгружаются все пользователи.
+    """
     with get_conn() as conn:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute('''
-                SELECT t.word_en, t.word_ru FROM (
-                    SELECT word_en, word_ru FROM user_words WHERE user_id = %(user_id)s
-                    UNION
-                    SELECT word_en, word_ru FROM words
-                ) as t
-                WHERE t.word_en != %(exclude)s
-                ORDER BY RANDOM()
-                LIMIT 3;
-            ''', {'user_id': user_id, 'exclude': word_to_exclude_en})
-            words = cur.fetchall()
-            return [(w['word_en'], w['word_ru']) for w in words] 
\ No newline at end of file
+        # Все три выборки видят один снимок БД, даже если экспорт идет долго
+        conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        for kind, query in EXPORT_QUERIES.items():
+            with conn.cursor(name=f'export_{kind}') as cur:
+                cur.itersize = itersize
+                cur.execute(query, {'user_id': user_id})
+                for row in cur:
+                    yield kind, row
+        conn.rollback()
@@ -0,0 +1,89 @@
+"""
+Экспорт истории обучения в CSV/JSONL.
+
+Строки пишутся в файл по мере чтения из БД, поэтому экспорт любого размера
+не накапливается в памяти. Используется ботом (кнопка "Экспорт") и как
+консольная утилита администратора:
+
+    python export.py --telegram-id 123456 --format jsonl -o export.jsonl
+    python export.py --all -o all_users.csv
+"""
+import argparse
+import csv
+import json
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import db  # noqa: E402 - настройки БД читаются из окружения при импорте
+
+FORMATS = ('csv', 'jsonl')
+
+# Колонки каждого типа строк из db.iter_export_rows (после telegram_id)
+ROW_FIELDS = {
+    'word': ('word_en', 'word_ru'),
+    'progress': ('progress_date', 'correct_answers'),
+    'achievement': ('achievement_id', 'achieved_at'),
+}
+
+CSV_FIELDS = ['type', 'telegram_id'] + [f for fields in ROW_FIELDS.values() for f in fields]
+
+
+def _row_to_dict(kind, row):
+    telegram_id, *values = row
+    record = {'type': kind, 'telegram_id': telegram_id}
+    for field, value in zip(ROW_FIELDS[kind], values):
+        record[field] = value.isoformat() if hasattr(value, 'isoformat') else value
+    return record
+
+
+def write_export(f, user_id=None, fmt='csv'):
+    """Пишет экспорт в открытый текстовый файл `f`. Возвращает число строк."""
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown export format: {fmt}')
+
+    if fmt == 'csv':
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        write_row = writer.writerow
+    else:
+        def write_row(record):
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    count = 0
+    for kind, row in db.iter_export_rows(user_id):
+        write_row(_row_to_dict(kind, row))
+        count += 1
+    return count
+
+
+def export_to_file(path, user_id=None, fmt='csv'):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        return write_export(f, user_id, fmt)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Экспорт прогресса пользователей EnglishBot.')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--telegram-id', type=int, help='Telegram ID пользователя')
+    target.add_argument('--all', action='store_true', help='Выгрузить всех пользователей')
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('-o', '--output', required=True, help='Путь к выходному файлу')
+    args = parser.parse_args(argv)
+
+    user_id = None
+    if args.telegram_id is not None:
+        user_id = db.get_user_id(args.telegram_id)
+        if user_id is None:
+            print(f'User with telegram_id {args.telegram_id} not found.', file=sys.stderr)
+            return 1
+
+    count = export_to_file(args.output, user_id, args.format)
+    print(f'Exported {count} rows to {args.output}.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,20 @@
+import gzip
 import random
 import os
+import shutil
+import tempfile
+import threading
+import time
 from collections import deque
+from contextlib import suppress
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from telebot import types, TeleBot, custom_filters
 from telebot.storage import StateMemoryStorage
 from telebot.handler_backends import State, StatesGroup
 import db
+import export
+import snapshot
 
 load_dotenv()
 
@@ -21,6 +30,7 @@ class Command:
     STATS = 'Статистика 📊'
     ACHIEVEMENTS = 'Достижения 🏆'
     SETTINGS = '⚙️ Режим'
+    EXPORT = 'Экспорт 📤'
 
 ACHIEVEMENTS_MAP = {
     'learned_10': '🎓 Новичок - Выучено 10 слов.',
@@ -32,8 +42,21 @@ ACHIEVEMENTS_MAP = {
     'first_word': '✍️ Первопроходец - Добавлено первое личное слово.',
 }
 
+# Снимок общего словаря (snapshot.WordSnapshot), открывается в init_db
+# и подменяется фоновым потоком, когда версия словаря в БД меняется
+common_words = None
+SNAPSHOT_REFRESH_SECONDS = 300
+
 # {user_id: {'review_queue': deque([...]), 'review_countdown': 0}}
 user_session = {}
+# Экспорты выполняются в небольшом пуле: каждый держит соединение с БД
+EXPORT_WORKERS = 2
+# Ограничение Telegram Bot API на размер отправляемого документа
+TELEGRAM_DOCUMENT_LIMIT = 50 * 1024 * 1024
+export_executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix='export')
+# telegram_id пользователей, для которых сейчас готовится экспорт
+exports_in_progress = set()
+exports_lock = threading.Lock()
 
 
 class MyStates(StatesGroup):
@@ -45,15 +68,63 @@ class MyStates(StatesGroup):
 
 
 def init_db():
+    global common_words
     print("Initializing database...")
     db.create_tables()
+    version, word_count = db.get_common_words_meta()
     # Если в базе нет слов, импортируем из файла
-    if not db.get_common_words():
+    if not word_count:
         print("Database is empty. Populating with initial words from 5000_words.txt...")
         print("This may take a moment, please wait...")
         db.import_words_from_txt('5000_words.txt')
         print("Database populated successfully.")
-    print("Database is ready.")
+        version, word_count = db.get_common_words_meta()
+    # Снимок пересобирается, только если словарь в БД изменился
+    common_words = snapshot.load_snapshot(version=version)
+    print(f"Database is ready. Common dictionary: {len(common_words)} words.")
+
+
+def refresh_common_words():
+    """Периодически сверяет версию словаря и подменяет снимок, если он устарел."""
+    global common_words
+    while True:
+        time.sleep(SNAPSHOT_REFRESH_SECONDS)
+        try:
+            version = db.get_common_words_meta()[0]
+            if common_words is None or common_words.version != version:
+                # load_snapshot сначала открывает файл заново и пересобирает его, только
+                # если другой процесс еще не сделал этого. Старый снимок не закрываем явно:
+                # обработчики держат на него локальную ссылку, и mmap освободится сам,
+                # когда последняя из них пропадет.
+                common_words = snapshot.load_snapshot(version=version)
+                print(f"Common dictionary snapshot refreshed: {len(common_words)} words.")
+        except Exception as e:
+            print(f"Snapshot refresh failed: {e}")
+
+
+def pick_random_words(user_id, count, exclude_en=None):
+    """
+    Возвращает до `count` случайных пар (word_en, word_ru) без повторов по word_en
+    из личных слов пользователя и общего словаря.
+    Общие слова берутся из mmap-снимка по случайному индексу, из БД читаются только личные.
+    """
+    words = common_words or ()  # локальная ссылка: снимок может подмениться во время выбора
+    user_count = db.count_user_words(user_id)
+    total = user_count + len(words)
+    picked = {}
+    # Пара лишних индексов на случай совпадений; несколько попыток, если их не хватило
+    for _ in range(3):
+        if len(picked) >= count or not total:
+            break
+        indices = random.sample(range(total), min(total, count + 2))
+        from_user = sum(1 for i in indices if i < user_count)
+        pairs = db.get_random_user_words(user_id, from_user) if from_user else []
+        pairs += [words[i - user_count] for i in indices if i >= user_count]
+        random.shuffle(pairs)
+        for word_en, word_ru in pairs:
+            if word_en != exclude_en and word_en not in picked and len(picked) < count:
+                picked[word_en] = word_ru
+    return list(picked.items())
 
 
 def get_main_keyboard():
@@ -66,7 +137,8 @@ def get_main_keyboard():
     )
     markup.add(
         types.KeyboardButton(Command.ACHIEVEMENTS),
-        types.KeyboardButton(Command.SETTINGS)
+        types.KeyboardButton(Command.SETTINGS),
+        types.KeyboardButton(Command.EXPORT)
     )
     return markup
 
@@ -84,7 +156,8 @@ def get_options_keyboard(options):
     )
     markup.add(
         types.KeyboardButton(Command.ACHIEVEMENTS),
-        types.KeyboardButton(Command.SETTINGS)
+        types.KeyboardButton(Command.SETTINGS),
+        types.KeyboardButton(Command.EXPORT)
     )
     markup.add(types.KeyboardButton(Command.NEXT))
     return markup
@@ -141,7 +214,7 @@ def next_question_handler(message):
     is_review_time = session['review_queue'] and session['review_countdown'] <= 0
     if is_review_time:
         correct_pair = session['review_queue'].popleft()
-        distractors = db.get_distractors(user_id, correct_pair[0])
+        distractors = pick_random_words(user_id, 3, exclude_en=correct_pair[0])
         
         if len(distractors) == 3:
             all_pairs = [correct_pair] + distractors
@@ -154,7 +227,7 @@ def next_question_handler(message):
     
     # Обычный выбор слова, если не было слова на повторение
     if correct_pair is None:
-        words = db.get_random_words_for_user(user_id)
+        words = pick_random_words(user_id, 4)
         if len(words) < 4:
             bot.send_message(message.chat.id, 'Недостаточно слов для тренировки. Добавьте еще!', reply_markup=get_main_keyboard())
             return
@@ -173,7 +246,7 @@ def next_question_handler(message):
     else: # en_ru
         question_word, answer_word = correct_pair[0], correct_pair[1]
         # Для режима EN-RU нужны русские варианты
-        distractors = db.get_distractors(user_id, correct_pair[0])
+        distractors = pick_random_words(user_id, 3, exclude_en=correct_pair[0])
         options = [answer_word] + [d[1] for d in distractors]
         random.shuffle(options)
 
@@ -267,7 +340,7 @@ def answer_handler(message):
     telegram_id = message.from_user.id
 
     # Сначала проверяем, не нажал ли пользователь на команду
-    if message.text in [Command.STATS, Command.ACHIEVEMENTS, Command.SETTINGS, Command.ADD_WORD, Command.DELETE_WORD]:
+    if message.text in [Command.STATS, Command.ACHIEVEMENTS, Command.SETTINGS, Command.ADD_WORD, Command.DELETE_WORD, Command.EXPORT]:
         bot.delete_state(telegram_id, message.chat.id)
         # Имитируем, что команду вызвал сам пользователь
         bot.process_new_messages([message])
@@ -353,9 +426,87 @@ def set_mode_callback(call):
     bot.send_message(call.message.chat.id, 'Нажмите "Дальше ▶", чтобы начать тренировку в новом режиме.', reply_markup=get_main_keyboard())
 
 
+@bot.message_handler(func=lambda m: m.text == Command.EXPORT)
+def export_handler(message):
+    markup = types.InlineKeyboardMarkup(row_width=2)
+    markup.add(
+        types.InlineKeyboardButton("CSV", callback_data="export:csv"),
+        types.InlineKeyboardButton("JSONL", callback_data="export:jsonl")
+    )
+    bot.send_message(message.chat.id, "Выберите формат экспорта вашего прогресса:", reply_markup=markup)
+
+
+def send_export(telegram_id, chat_id, fmt):
+    """Готовит файл экспорта и отправляет его документом. Выполняется в пуле export_executor."""
+    paths = []
+    try:
+        user_id = db.get_user_id(telegram_id)
+        if user_id is None:
+            # Без user_id экспорт выгрузил бы всех пользователей
+            bot.send_message(chat_id, 'Сначала нажмите /start.', reply_markup=get_main_keyboard())
+            return
+        with tempfile.NamedTemporaryFile('w', suffix=f'.{fmt}', encoding='utf-8', newline='', delete=False) as f:
+            paths.append(f.name)
+            export.write_export(f, user_id, fmt)
+        path, file_name = paths[0], f'englishbot_export.{fmt}'
+
+        # Слишком большой файл пробуем сжать, чтобы уложиться в лимит Telegram
+        if os.path.getsize(path) > TELEGRAM_DOCUMENT_LIMIT:
+            gz_path = path + '.gz'
+            try:
+                with open(path, 'rb') as src, gzip.open(gz_path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+            finally:
+                paths.append(gz_path)
+            path, file_name = gz_path, file_name + '.gz'
+        if os.path.getsize(path) > TELEGRAM_DOCUMENT_LIMIT:
+            bot.send_message(
+                chat_id,
+                'Экспорт получился больше 50 МБ, и Telegram не позволяет его отправить. '
+                'Обратитесь к администратору за выгрузкой.',
+                reply_markup=get_main_keyboard()
+            )
+            return
+
+        with open(path, 'rb') as f:
+            bot.send_document(chat_id, f, visible_file_name=file_name, reply_markup=get_main_keyboard())
+    except Exception as e:
+        print(f"Export failed for {telegram_id}: {e}")
+        bot.send_message(chat_id, 'Не удалось подготовить экспорт. Попробуйте позже.', reply_markup=get_main_keyboard())
+    finally:
+        try:
+            for path in paths:
+                with suppress(FileNotFoundError):
+                    os.remove(path)
+        finally:
+            with exports_lock:
+                exports_in_progress.discard(telegram_id)
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith('export:'))
+def export_callback(call):
+    fmt = call.data.split(':')[1]
+    if fmt not in export.FORMATS:
+        bot.answer_callback_query(call.id, "Неизвестный формат экспорта.")
+        return
+    telegram_id = call.from_user.id
+    with exports_lock:
+        already_running = telegram_id in exports_in_progress
+        exports_in_progress.add(telegram_id)
+    if already_running:
+        bot.answer_callback_query(call.id, "Экспорт уже готовится, подождите.")
+        return
+
+    bot.answer_callback_query(call.id)
+    bot.edit_message_text(f"⏳ Готовим экспорт в формате <b>{fmt.upper()}</b>...", call.message.chat.id, call.message.message_id, reply_markup=None)
+    # Большие выгрузки не должны занимать обработчики бота
+    export_executor.submit(send_export, telegram_id, call.message.chat.id, fmt)
+
+
 bot.add_custom_filter(custom_filters.StateFilter(bot))
 
 if __name__ == '__main__':
     init_db()
+    threading.Thread(target=refresh_common_words, daemon=True).start()
     print("Bot is starting...")
     bot.infinity_polling(skip_pending=True) 
\ No newline at end of file
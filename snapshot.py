@@ -0,0 +1,178 @@
+"""
+Бинарный снимок общего словаря, открываемый через mmap.
+
+Формат файла (все числа little-endian, uint64):
+
+    заголовок:  magic b'EBWSNAP2', версия словаря из words_meta, число слов N
+    смещения:   2N + 1 смещений в блоке строк (word_en_0, word_ru_0, word_en_1, ...)
+    строки:     UTF-8 строки подряд, без разделителей
+
+Все процессы бота открывают один и тот же файл только для чтения, поэтому ОС
+держит в памяти одну общую копию, а открытие не зависит от размера словаря.
+
+Снимок, собранный из txt-файла, получает версию TXT_VERSION и предназначен
+только для офлайн-использования: load_snapshot всегда заменит его снимком из БД.
+"""
+import argparse
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import db  # noqa: E402 - настройки БД читаются из окружения при импорте
+
+MAGIC = b'EBWSNAP2'
+HEADER = struct.Struct('<8sQQ')
+OFFSET = struct.Struct('<Q')
+DEFAULT_PATH = 'words.snapshot'
+# Версии в words_meta начинаются с 1, так что txt-снимок никогда не совпадет с БД
+TXT_VERSION = 0
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class WordSnapshot:
+    """Доступ к снимку словаря по индексу без загрузки его в память."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, size = HEADER.unpack_from(self._mm, 0)
+        except struct.error:
+            self._mm.close()
+            raise SnapshotError(f'{path}: file is too short')
+        blob_start = HEADER.size + (2 * size + 1) * OFFSET.size
+        if magic != MAGIC or len(self._mm) < blob_start:
+            self._mm.close()
+            raise SnapshotError(f'{path}: not a word snapshot')
+        self.version = version
+        self._size = size
+        self._blob_start = blob_start
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError('word snapshot index out of range')
+        return self._string(2 * index), self._string(2 * index + 1)
+
+    def __iter__(self):
+        for i in range(self._size):
+            yield self[i]
+
+    def _string(self, n):
+        start, end = struct.unpack_from('<QQ', self._mm, HEADER.size + n * OFFSET.size)
+        return str(self._mm[self._blob_start + start:self._blob_start + end], 'utf-8')
+
+    def close(self):
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_snapshot(path, pairs, version):
+    """
+    Записывает снимок из итератора пар (word_en, word_ru) с указанной версией.
+    Файл подменяется атомарно, так что уже открытые снимки остаются рабочими.
+    """
+    offsets = array('Q', [0])
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f, tempfile.TemporaryFile() as blob:
+            position = 0
+            for pair in pairs:
+                for word in pair:
+                    data = word.encode('utf-8')
+                    blob.write(data)
+                    position += len(data)
+                    offsets.append(position)
+            size = (len(offsets) - 1) // 2
+            f.write(HEADER.pack(MAGIC, version, size))
+            if sys.byteorder == 'big':
+                offsets.byteswap()
+            offsets.tofile(f)
+            blob.seek(0)
+            shutil.copyfileobj(blob, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return size
+
+
+def build_from_db(path=DEFAULT_PATH):
+    """Строит снимок из таблицы `words`. Возвращает число слов."""
+    with db.read_common_words() as (version, pairs):
+        return write_snapshot(path, pairs, version)
+
+
+def build_from_txt(filepath, path=DEFAULT_PATH):
+    """Строит офлайн-снимок из файла формата '"word";"перевод"' (без версии БД)."""
+    return write_snapshot(path, db.iter_words_from_txt(filepath), TXT_VERSION)
+
+
+def _open_if_current(path, version):
+    """Открывает снимок, если он существует и его версия равна `version`, иначе None."""
+    try:
+        snapshot = WordSnapshot(path)
+    except (OSError, ValueError, SnapshotError):
+        return None
+    if snapshot.version == version:
+        return snapshot
+    snapshot.close()
+    return None
+
+
+def load_snapshot(path=DEFAULT_PATH, version=None):
+    """
+    Открывает снимок словаря, предварительно пересобирая его,
+    если файла нет, он поврежден или его версия отличается от `words_meta`.
+    Уже прочитанную версию можно передать в `version`, чтобы не запрашивать ее снова.
+    """
+    if version is None:
+        version = db.get_common_words_meta()[0]
+    snapshot = _open_if_current(path, version)
+    if snapshot is None:
+        # Пересобирает один процесс; остальные дождутся блокировки и откроют готовый файл
+        with db.advisory_lock(db.SNAPSHOT_LOCK_KEY):
+            snapshot = _open_if_current(path, version)
+            if snapshot is None:
+                build_from_db(path)
+                snapshot = WordSnapshot(path)
+    return snapshot
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Сборка снимка общего словаря EnglishBot.')
+    parser.add_argument('--from-txt', metavar='FILE', help='Собрать офлайн-снимок из txt-файла вместо таблицы words')
+    parser.add_argument('-o', '--output', default=DEFAULT_PATH, help='Путь к файлу снимка')
+    args = parser.parse_args(argv)
+
+    if args.from_txt:
+        size = build_from_txt(args.from_txt, args.output)
+    else:
+        size = build_from_db(args.output)
+    print(f'Snapshot with {size} words written to {args.output}.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())